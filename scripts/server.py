@@ -5,25 +5,37 @@ Conversation flows via OpenClaw chatCompletions API with full agent personality
 
 import os
 import re
-import uuid
-import subprocess
-import json
+import secrets
+import asyncio
 import base64
+import hashlib
+import io
+import itertools
 import struct
 import tempfile
 import logging
+import shutil
+import wave
 from pathlib import Path
-from typing import Optional
+from typing import IO, AsyncIterator, Optional
+from urllib.parse import quote
 
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 import httpx
+import edge_tts
+import orjson
+
+try:  # Optional: in-process decode instead of an ffmpeg subprocess per turn
+    import av
+except ImportError:
+    av = None
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 logger = logging.getLogger("videochat-withme")
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 AUDIO_DIR = Path(tempfile.gettempdir()) / "videochat_me_audio"
 AUDIO_DIR.mkdir(exist_ok=True)
@@ -58,7 +70,7 @@ def _load_gateway_config() -> tuple[int, str]:
     if not config_path.exists():
         raise RuntimeError("OpenClaw config not found at ~/.openclaw/openclaw.json")
 
-    config = json.loads(config_path.read_text())
+    config = orjson.loads(config_path.read_bytes())
     gw = config.get("gateway", {})
     port = gw.get("port", 18789)
     token = gw.get("auth", {}).get("token", "")
@@ -70,31 +82,80 @@ def _load_gateway_config() -> tuple[int, str]:
 GROQ_API_KEY = _load_groq_key()
 GROQ_BASE = "https://api.groq.com/openai/v1"
 
+# Whisper model for STT. whisper-large-v3-turbo is Groq's fastest multilingual
+# model; whisper-large-v3 is slower with slightly lower WER. Groq's distilled
+# model (distil-whisper-large-v3-en) is faster still but English-only.
+STT_MODEL = os.environ.get("STT_MODEL", "whisper-large-v3-turbo")
+
 GW_PORT, GW_TOKEN = _load_gateway_config()
 OPENCLAW_BASE = f"http://127.0.0.1:{GW_PORT}"
 
 logger.info("Gateway configured on port %d", GW_PORT)
 
 PORT = int(os.environ.get("PORT", "8766"))
+DEBUG = os.environ.get("DEBUG", "").lower() in ("1", "true", "yes")
+
+# Request ids for debug dump filenames: pid prefix + counter, unique per process
+# without a urandom call. Reply ids handed to clients use secrets instead.
+_ID_PREFIX = f"{os.getpid():x}"
+_ID_COUNTER = itertools.count()
+
+
+def _req_id() -> str:
+    return f"{_ID_PREFIX}_{next(_ID_COUNTER):x}"
+
 
 ASSETS_DIR = Path(__file__).parent.parent / "assets"
 
+# The page is static for the life of the process: read it once and let
+# browsers revalidate with If-None-Match.
+_INDEX_BYTES = (ASSETS_DIR / "index.html").read_bytes()
+_INDEX_ETAG = f'"{hashlib.blake2b(_INDEX_BYTES, digest_size=8).hexdigest()}"'
+
+# Shared HTTP clients, created at startup so connections are reused across
+# turns. CLIENT talks to the local OpenClaw gateway over plain HTTP/1.1 (httpx
+# only negotiates HTTP/2 over TLS); GROQ_CLIENT keeps one HTTP/2 session open
+# to api.groq.com with auth baked in.
+CLIENT: httpx.AsyncClient | None = None
+GROQ_CLIENT: httpx.AsyncClient | None = None
+
+
+@app.on_event("startup")
+async def _open_clients() -> None:
+    global CLIENT, GROQ_CLIENT
+    CLIENT = httpx.AsyncClient(
+        timeout=60,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+    )
+    GROQ_CLIENT = httpx.AsyncClient(
+        http2=True,
+        base_url=GROQ_BASE,
+        headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
+        timeout=15,
+    )
+
+
+@app.on_event("shutdown")
+async def _close_clients() -> None:
+    for client in (CLIENT, GROQ_CLIENT):
+        if client is not None:
+            await client.aclose()
+
 
 # ─── Routes ───
 
 
 @app.get("/", response_class=HTMLResponse)
-async def index():
-    html_path = ASSETS_DIR / "index.html"
-    return HTMLResponse(
-        content=html_path.read_text(encoding="utf-8"),
-        headers={"Cache-Control": "no-cache, no-store, must-revalidate", "Pragma": "no-cache", "Expires": "0"},
-    )
+async def index(request: Request):
+    headers = {"ETag": _INDEX_ETAG, "Cache-Control": "public, max-age=60"}
+    if _INDEX_ETAG in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=_INDEX_BYTES, headers=headers)
 
 
 @app.get("/api/config")
 async def config():
-    return JSONResponse({
+    return ORJSONResponse({
         "agent_name": AGENT_NAME,
         "user_name": USER_NAME,
     })
@@ -107,78 +168,181 @@ async def chat(
     speed: str = Form("normal"),
     language: str = Form("zh"),
     voice: str = Form("zh-CN-XiaoxiaoNeural"),
+    stt_model: Optional[str] = None,
 ):
-    req_id = uuid.uuid4().hex
-
-    # Save uploads
-    audio_path = AUDIO_DIR / f"{req_id}.webm"
-    audio_bytes = await audio.read()
-    audio_path.write_bytes(audio_bytes)
-
-    image_bytes = None
-    if image is not None:
-        image_bytes = await image.read()
-        if image_bytes:
-            image_path = AUDIO_DIR / f"{req_id}.jpg"
-            image_path.write_bytes(image_bytes)
-
-    # Convert audio for Whisper
-    wav_path = AUDIO_DIR / f"{req_id}.wav"
-    try:
-        result = subprocess.run(
-            ["ffmpeg", "-y", "-i", str(audio_path), "-ar", "16000", "-ac", "1", str(wav_path)],
-            capture_output=True, timeout=30,
-        )
-        if result.returncode != 0 or not wav_path.exists():
-            logger.warning("ffmpeg failed (rc=%d)", result.returncode)
-            wav_path = audio_path
-    except (FileNotFoundError, subprocess.TimeoutExpired) as e:
-        logger.warning("ffmpeg exception: %s", e)
-        wav_path = audio_path
+    if DEBUG:
+        # Keep the raw upload around for inspection; off the event loop.
+        await asyncio.to_thread(_dump_upload, audio.file, AUDIO_DIR / f"{_req_id()}.webm")
 
-    # Pipeline: STT → OpenClaw Chat → TTS
-    transcription = transcribe_audio(wav_path)
+    image_bytes = await image.read() if image is not None else None
 
-    img_b64 = base64.b64encode(image_bytes).decode("utf-8") if image_bytes else None
-    reply_text = await get_openclaw_reply(transcription, img_b64, language)
+    # Pipeline: STT → OpenClaw Chat (streamed) → TTS per sentence (streamed).
+    # The frame is encoded on a worker thread while ffmpeg + Whisper run.
+    transcription, img_b64 = await asyncio.gather(
+        transcribe_upload(audio, stt_model or STT_MODEL),
+        asyncio.to_thread(lambda: base64.b64encode(image_bytes) if image_bytes else None),
+    )
 
-    # TTS with speed and voice
-    reply_filename = f"{req_id}_reply.mp3"
-    reply_path = AUDIO_DIR / reply_filename
-    generate_tts(reply_text, reply_path, voice=voice, speed=speed)
+    rate_map = {"fast": "+30%", "slow": "-30%", "normal": "+0%"}
+    rate = rate_map.get(speed, "+0%")
 
-    return {
-        "text": reply_text,
-        "audio_url": f"/audio/{reply_filename}",
-        "transcription": transcription,
-    }
+    # The reply id is the only thing guarding /api/reply, so it must be unguessable.
+    reply_id = secrets.token_urlsafe(16)
+    reply = _Reply()
+    _REPLIES[reply_id] = reply
+    while len(_REPLIES) > _MAX_PENDING_REPLIES:
+        _REPLIES.pop(next(iter(_REPLIES)))
+
+    return StreamingResponse(
+        stream_reply_audio(reply, transcription, img_b64, language, voice, rate),
+        media_type="audio/mpeg",
+        headers={
+            "Cache-Control": "no-store",
+            "X-Reply-Id": reply_id,
+            "X-Transcription": quote(transcription),
+        },
+    )
 
 
-@app.get("/audio/{filename}")
-async def get_audio(filename: str):
-    safe_name = Path(filename).name
-    file_path = AUDIO_DIR / safe_name
-    if not file_path.exists():
-        return JSONResponse({"error": "not found"}, status_code=404)
-    media = "audio/mpeg" if safe_name.endswith(".mp3") else "audio/wav"
-    return FileResponse(file_path, media_type=media)
+@app.get("/api/reply/{reply_id}")
+async def get_reply(reply_id: str):
+    """Return the reply text for a streamed /api/chat response.
+
+    Blocks until the LLM stream has finished, which is usually well before
+    the last TTS sentence has been synthesized.
+    """
+    reply = _REPLIES.get(reply_id)
+    if reply is None:
+        return ORJSONResponse({"error": "not found"}, status_code=404)
+    try:
+        await asyncio.wait_for(reply.done.wait(), timeout=90)
+    except asyncio.TimeoutError:
+        return ORJSONResponse({"error": "timeout"}, status_code=504)
+    _REPLIES.pop(reply_id, None)
+    return {"text": reply.text}
 
 
 # ─── Pipeline Stage 1: STT (Groq Whisper) ───
 
 
-def transcribe_audio(audio_path: Path) -> str:
+async def _run_ffmpeg(
+    args: list[str], input: bytes | AsyncIterator[bytes] | None = None, timeout: float = 30
+) -> bytes | None:
+    """Run ffmpeg without blocking the event loop. Returns stdout, or None on failure.
+
+    input may be bytes or an async iterator of chunks, which is fed to stdin
+    while stdout is drained so neither pipe can fill up and stall ffmpeg.
+    """
     try:
-        with open(audio_path, "rb") as f:
-            resp = httpx.post(
-                f"{GROQ_BASE}/audio/transcriptions",
-                headers={"Authorization": f"Bearer {GROQ_API_KEY}"},
-                files={"file": (audio_path.name, f, "audio/wav")},
-                data={"model": "whisper-large-v3-turbo", "language": "zh"},
-                timeout=15,
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error", *args,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found in PATH")
+        return None
+
+    async def feed() -> None:
+        try:
+            async for chunk in input:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg exited early; its return code says why
+        finally:
+            proc.stdin.close()
+
+    try:
+        if input is None or isinstance(input, bytes):
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout=timeout)
+        else:
+            _, stdout, stderr = await asyncio.wait_for(
+                asyncio.gather(feed(), proc.stdout.read(), proc.stderr.read()), timeout=timeout
             )
+            await proc.wait()
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        logger.warning("ffmpeg timed out after %ss", timeout)
+        return None
+    if proc.returncode != 0 or not stdout:
+        logger.warning("ffmpeg failed (rc=%d): %s", proc.returncode, stderr.decode(errors="replace")[:300])
+        return None
+    return stdout
+
+
+def _dump_upload(src: IO[bytes], path: Path) -> None:
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    src.seek(0)
+
+
+async def _iter_upload(upload: UploadFile, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+def _decode_to_wav16k(src: IO[bytes]) -> bytes:
+    """Decode and resample a recording to 16kHz mono 16-bit WAV with PyAV."""
+    out = io.BytesIO()
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=16000)
+    with av.open(src) as container, wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        stream = container.streams.audio[0]
+        samples = 0
+        for frame in container.decode(stream):
+            for rs in resampler.resample(frame):
+                wav.writeframes(bytes(rs.planes[0])[: rs.samples * 2])
+                samples += rs.samples
+        for rs in resampler.resample(None):  # flush buffered samples
+            wav.writeframes(bytes(rs.planes[0])[: rs.samples * 2])
+            samples += rs.samples
+    if not samples:
+        # A header-only WAV is truthy; raise so the ffmpeg fallback runs.
+        raise ValueError("no audio samples decoded")
+    return out.getvalue()
+
+
+async def transcribe_upload(upload: UploadFile, model: str = STT_MODEL) -> str:
+    """Convert a browser recording to 16kHz mono WAV for Whisper and transcribe it.
+
+    The upload is read in chunks straight from its spooled file, never
+    materialized as one bytes object.
+    """
+    wav_bytes = None
+    if av is not None:
+        try:
+            wav_bytes = await asyncio.to_thread(_decode_to_wav16k, upload.file)
+        except Exception as e:
+            logger.warning("PyAV decode failed, falling back to ffmpeg: %s", e)
+        await upload.seek(0)
+    if not wav_bytes:
+        wav_bytes = await _run_ffmpeg(
+            ["-i", "pipe:0", "-ar", "16000", "-ac", "1", "-f", "wav", "pipe:1"],
+            input=_iter_upload(upload),
+        )
+    if wav_bytes:
+        return await transcribe_audio(wav_bytes, "audio.wav", model)
+    # Fall back to the raw upload; Whisper accepts webm directly
+    await upload.seek(0)
+    return await transcribe_audio(upload.file, "audio.webm", model)
+
+
+async def transcribe_audio(
+    audio: bytes | IO[bytes], filename: str = "audio.wav", model: str = STT_MODEL
+) -> str:
+    try:
+        resp = await GROQ_CLIENT.post(
+            "/audio/transcriptions",
+            files={"file": (filename, audio, "audio/wav")},
+            data={"model": model, "language": "zh"},
+        )
         if resp.status_code == 200:
-            text = resp.json().get("text", "").strip()
+            text = orjson.loads(resp.content).get("text", "").strip()
             return text if text else "[空白录音]"
         return f"[STT error: {resp.status_code}]"
     except Exception as e:
@@ -188,109 +352,163 @@ def transcribe_audio(audio_path: Path) -> str:
 # ─── Pipeline Stage 2: Chat via OpenClaw ───
 
 
-async def get_openclaw_reply(transcript: str, image_b64: str | None, language: str = "zh") -> str:
+def _build_prompts() -> dict[tuple[bool, bool], str]:
+    """Prompt templates keyed by (has_image, english); only {transcript} is left open."""
+    user = USER_NAME.replace("{", "{{").replace("}", "}}")
+    agent = AGENT_NAME.replace("{", "{{").replace("}", "}}")
+    prompts = {}
+    for english in (False, True):
+        lang_instruction = "Please reply in English. Reply in English." if english else "请用中文回复。"
+        prompts[True, english] = (
+            f"[Video Call] {user} says: \"{{transcript}}\"\n\n"
+            f"You are on a video call with {user}. A camera frame is attached. "
+            "Respond naturally as in a real video call: short, conversational, 1-3 sentences. "
+            "No markdown formatting. Feel free to comment on what you see in the frame. "
+            f"Stay in character as {agent}. {lang_instruction}"
+        )
+        prompts[False, english] = (
+            f"[Video Call] {user} says: \"{{transcript}}\"\n\n"
+            f"You are on a video call with {user} (camera is off, no video). "
+            "Respond naturally as in a real video call: short, conversational, 1-3 sentences. "
+            f"No markdown formatting. Stay in character as {agent}. {lang_instruction}"
+        )
+    return prompts
+
+
+_PROMPTS = _build_prompts()
+
+_OPENCLAW_HEADERS = {
+    "Authorization": f"Bearer {GW_TOKEN}",
+    "Content-Type": "application/json",
+    "x-openclaw-agent-id": "main",
+}
+
+# Placeholder for the frame's data URL. The payload is serialized without the
+# image and the base64 bytes are spliced in afterwards, so the (large) frame is
+# never decoded to str or re-escaped by the JSON encoder.
+_IMAGE_URL_MARKER = "__videochat_image_url__"
+
+
+def _encode_payload(payload: dict, image_b64: bytes | None) -> bytes:
+    body = orjson.dumps(payload)
+    if image_b64 is None:
+        return body
+    head, tail = body.rsplit(_IMAGE_URL_MARKER.encode(), 1)
+    # The base64 alphabet needs no JSON escaping.
+    return b"".join((head, b"data:image/jpeg;base64,", image_b64, tail))
+
+
+async def stream_openclaw_reply(
+    transcript: str, image_b64: bytes | None, language: str = "zh"
+) -> AsyncIterator[str]:
     """
-    Send message to OpenClaw chatCompletions API.
+    Stream a reply from the OpenClaw chatCompletions API as text deltas.
     Routes to the main agent with full memory and personality.
     The 'user' field creates a stable session for videochat conversations.
     """
+    got_any = False
     try:
-        lang_instruction = (
-            "Please reply in English. Reply in English."
-            if language == "en"
-            else "请用中文回复。"
-        )
-
+        template = _PROMPTS[bool(image_b64), language == "en"]
+        prompt_text = template.format(transcript=transcript)
         if image_b64:
-            prompt_text = (
-                f"[Video Call] {USER_NAME} says: \"{transcript}\"\n\n"
-                f"You are on a video call with {USER_NAME}. A camera frame is attached. "
-                "Respond naturally as in a real video call: short, conversational, 1-3 sentences. "
-                "No markdown formatting. Feel free to comment on what you see in the frame. "
-                f"Stay in character as {AGENT_NAME}. {lang_instruction}"
-            )
             content = [
                 {"type": "text", "text": prompt_text},
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_b64}"},
+                    "image_url": {"url": _IMAGE_URL_MARKER},
                 },
             ]
         else:
-            content = (
-                f"[Video Call] {USER_NAME} says: \"{transcript}\"\n\n"
-                f"You are on a video call with {USER_NAME} (camera is off, no video). "
-                "Respond naturally as in a real video call: short, conversational, 1-3 sentences. "
-                f"No markdown formatting. Stay in character as {AGENT_NAME}. {lang_instruction}"
-            )
+            content = prompt_text
 
-        headers = {
-            "Authorization": f"Bearer {GW_TOKEN}",
-            "Content-Type": "application/json",
-            "x-openclaw-agent-id": "main",
-        }
         payload = {
             "model": "openclaw",
             "messages": [{"role": "user", "content": content}],
             "user": "videochat-session",
+            "stream": True,
         }
 
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(
-                f"{OPENCLAW_BASE}/v1/chat/completions",
-                headers=headers,
-                json=payload,
-            )
-
-        if resp.status_code == 200:
-            data = resp.json()
-            text = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            return text.strip() if text else "Hmm... I spaced out for a moment."
-        else:
-            logger.error("OpenClaw API error %d: %s", resp.status_code, resp.text[:200])
-            return "I heard you, but my brain glitched for a sec..."
+        async with CLIENT.stream(
+            "POST",
+            f"{OPENCLAW_BASE}/v1/chat/completions",
+            headers=_OPENCLAW_HEADERS,
+            content=_encode_payload(payload, image_b64),
+        ) as resp:
+            if resp.status_code != 200:
+                body = await resp.aread()
+                logger.error("OpenClaw API error %d: %s", resp.status_code, body[:200])
+                yield "I heard you, but my brain glitched for a sec..."
+                return
+
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = orjson.loads(data)
+                    choices = chunk.get("choices") or [{}]
+                    delta = (choices[0].get("delta") or {}).get("content")
+                except (orjson.JSONDecodeError, AttributeError, IndexError, KeyError, TypeError):
+                    # Skip malformed chunks rather than cutting the reply short
+                    continue
+                if isinstance(delta, str) and delta:
+                    got_any = True
+                    yield delta
+
+        if not got_any:
+            yield "Hmm... I spaced out for a moment."
 
     except httpx.TimeoutException:
-        return f"I heard: {transcript}... but I took too long thinking, sorry!"
+        if not got_any:
+            yield f"I heard: {transcript}... but I took too long thinking, sorry!"
     except Exception as e:
         logger.error("OpenClaw error: %s", e)
-        return f"I heard: {transcript} (connection issue)"
+        if not got_any:
+            yield f"I heard: {transcript} (connection issue)"
 
 
 # ─── Pipeline Stage 3: TTS (edge-tts) ───
 
+# Bound concurrent edge-tts sessions so a long reply can't flood the service.
+_TTS_SEMAPHORE = asyncio.Semaphore(3)
+
+
+async def _edge_tts_bytes(text: str, voice: str, rate: str) -> bytes:
+    """Synthesize text in-process, collecting the MP3 audio chunks in memory."""
+    comm = edge_tts.Communicate(text, voice, rate=rate)
+    buf = bytearray()
+    async for chunk in comm.stream():
+        if chunk["type"] == "audio":
+            buf.extend(chunk["data"])
+    return bytes(buf)
 
-def _run_edge_tts(text: str, output_path: Path, voice: str, rate: str, max_retries: int = 3) -> bool:
-    """Run edge-tts with retry. Returns True on success."""
-    import time
+
+async def _run_edge_tts(text: str, voice: str, rate: str, max_retries: int = 3) -> bytes | None:
+    """Run edge-tts with retry. Returns None on failure."""
     for attempt in range(1, max_retries + 1):
         try:
             logger.info("TTS attempt %d/%d for %d chars", attempt, max_retries, len(text))
-            result = subprocess.run(
-                [
-                    "edge-tts",
-                    "--voice", voice,
-                    "--rate", rate,
-                    "--text", text,
-                    "--write-media", str(output_path),
-                ],
-                capture_output=True,
-                timeout=30,
-            )
-            if result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 1000:
-                return True
-            stderr = result.stderr.decode(errors="replace") if result.stderr else ""
-            logger.warning("TTS attempt %d failed: rc=%d, stderr=%s", attempt, result.returncode, stderr[:300])
-        except subprocess.TimeoutExpired:
+            async with _TTS_SEMAPHORE:
+                audio = await asyncio.wait_for(_edge_tts_bytes(text, voice, rate), timeout=30)
+            if len(audio) > 1000:
+                return audio
+            logger.warning("TTS attempt %d failed: only %d bytes of audio", attempt, len(audio))
+        except asyncio.TimeoutError:
             logger.warning("TTS attempt %d timed out", attempt)
-        except FileNotFoundError:
-            logger.error("edge-tts not found in PATH")
-            return False
         except Exception as e:
             logger.warning("TTS attempt %d exception: %s", attempt, e)
         if attempt < max_retries:
-            time.sleep(1)
-    return False
+            await asyncio.sleep(1)
+    return None
+
+
+# Sentence boundary: zero-width split after a run of CJK terminal punctuation or
+# newlines once more text follows, or after Latin .!? followed by whitespace
+# (so "3.14", "e.g." and "..." stay whole).
+_SENT_RE = re.compile(r'(?<=[。！？\n])(?=[^。！？\n])|(?<=[.!?])(?=\s)')
+_WORD_RE = re.compile(r'\w')
 
 
 def _split_text(text: str, max_len: int = 200) -> list[str]:
@@ -298,109 +516,205 @@ def _split_text(text: str, max_len: int = 200) -> list[str]:
     if len(text) <= max_len:
         return [text]
     chunks = []
-    sentences = re.split(r'(?<=[。！？.!?\n])', text)
     current = ""
-    for s in sentences:
+    for s in _SENT_RE.split(text):
         if not s:
             continue
-        if len(current) + len(s) > max_len and current:
+        if current and len(current) + len(s) > max_len:
             chunks.append(current)
-            current = s
-        else:
-            current += s
+            current = ""
+        # A single sentence longer than max_len is hard-split in place.
+        while len(s) > max_len:
+            chunks.append(s[:max_len])
+            s = s[max_len:]
+        current += s
     if current:
         chunks.append(current)
-    result = []
-    for chunk in chunks:
-        while len(chunk) > max_len:
-            result.append(chunk[:max_len])
-            chunk = chunk[max_len:]
-        if chunk:
-            result.append(chunk)
-    return result
+    return chunks
 
 
-def generate_tts(text: str, output_path: Path, voice: str = "zh-CN-XiaoxiaoNeural", speed: str = "normal") -> None:
-    rate_map = {"fast": "+30%", "slow": "-30%", "normal": "+0%"}
-    rate = rate_map.get(speed, "+0%")
+TTS_CACHE_DIR = AUDIO_DIR / "tts_cache"
+TTS_CACHE_DIR.mkdir(exist_ok=True)
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+_TTS_CACHE_SWEEP_EVERY = 50
+_tts_cache_writes = 0
 
-    chunks = _split_text(text)
 
-    if len(chunks) == 1:
-        if _run_edge_tts(text, output_path, voice, rate):
-            return
-    else:
-        logger.info("Long text (%d chars) split into %d chunks", len(text), len(chunks))
-        part_paths = []
-        all_ok = True
-        for i, chunk in enumerate(chunks):
-            part_path = output_path.with_name(f"{output_path.stem}_part{i}.mp3")
-            if _run_edge_tts(chunk, part_path, voice, rate):
-                part_paths.append(part_path)
-            else:
-                logger.warning("Chunk %d failed, aborting concat", i)
-                all_ok = False
-                break
-
-        if all_ok and part_paths:
-            try:
-                list_file = output_path.with_suffix(".txt")
-                list_file.write_text(
-                    "\n".join(f"file '{p}'" for p in part_paths),
-                    encoding="utf-8",
-                )
-                result = subprocess.run(
-                    [
-                        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                        "-i", str(list_file), "-c", "copy", str(output_path),
-                    ],
-                    capture_output=True,
-                    timeout=30,
-                )
-                if result.returncode == 0 and output_path.exists() and output_path.stat().st_size > 1000:
-                    for p in part_paths:
-                        p.unlink(missing_ok=True)
-                    list_file.unlink(missing_ok=True)
-                    return
-                stderr = result.stderr.decode(errors="replace") if result.stderr else ""
-                logger.warning("ffmpeg concat failed: rc=%d, stderr=%s", result.returncode, stderr[:300])
-            except Exception as e:
-                logger.warning("ffmpeg concat exception: %s", e)
-
-        for p in part_paths:
-            p.unlink(missing_ok=True)
-
-    # Fallback: generate silent MP3
-    logger.warning("All TTS attempts failed, generating silent MP3 fallback")
-    _write_silent_mp3(output_path)
-
-
-def _write_silent_mp3(path: Path):
-    """Generate a short silent MP3 file using ffmpeg."""
+def _tts_cache_path(text: str, voice: str, rate: str) -> Path:
+    key = hashlib.blake2b(f"{voice}|{rate}|{text}".encode(), digest_size=16).hexdigest()
+    return TTS_CACHE_DIR / f"{key}.mp3"
+
+
+def _sweep_tts_cache() -> None:
+    """Delete least recently used cache files until the cache fits its budget."""
+    files = []
+    for f in TTS_CACHE_DIR.glob("*.mp3"):
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, f))
+    total = sum(size for _, size, _ in files)
+    for _, size, f in sorted(files):
+        if total <= TTS_CACHE_MAX_BYTES:
+            break
+        f.unlink(missing_ok=True)
+        total -= size
+
+
+def _load_tts_cache(path: Path) -> bytes | None:
     try:
-        subprocess.run(
-            [
-                "ffmpeg", "-y", "-f", "lavfi", "-i",
-                "anullsrc=r=24000:cl=mono", "-t", "0.5",
-                "-c:a", "libmp3lame", "-b:a", "32k", str(path),
-            ],
-            capture_output=True,
-            timeout=10,
-        )
-        if path.exists() and path.stat().st_size > 0:
-            return
-    except Exception as e:
-        logger.warning("Silent MP3 generation failed: %s", e)
+        audio = path.read_bytes()
+        os.utime(path)  # mark as recently used for the LRU sweep
+        return audio
+    except OSError:
+        return None
+
+
+def _store_tts_cache(path: Path, audio: bytes, sweep: bool) -> None:
+    """Best-effort cache write; a full or unwritable cache dir is only logged."""
+    try:
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(audio)
+        tmp.replace(path)
+        if sweep:
+            _sweep_tts_cache()
+    except OSError as e:
+        logger.warning("TTS cache write failed: %s", e)
+
+
+async def generate_tts(text: str, voice: str = "zh-CN-XiaoxiaoNeural", rate: str = "+0%") -> bytes:
+    """Synthesize text to MP3 bytes. Returns b"" if every attempt failed."""
+    global _tts_cache_writes
+    cache_path = _tts_cache_path(text, voice, rate)
+    # Cache I/O (and the periodic directory sweep) stays off the event loop.
+    audio = await asyncio.to_thread(_load_tts_cache, cache_path)
+    if audio is not None:
+        return audio
+
+    chunks = _split_text(text)
+    if len(chunks) > 1:
+        logger.info("Long text (%d chars) split into %d chunks", len(text), len(chunks))
 
-    # Last resort: write minimal silent WAV
+    # edge-tts always emits the same MP3 format, so frames concatenate as-is.
+    parts = await asyncio.gather(*[_run_edge_tts(c, voice, rate) for c in chunks])
+    ok = []
+    for i, part in enumerate(parts):
+        if part is None:
+            logger.warning("Chunk %d failed, dropping remainder", i)
+            break
+        ok.append(part)
+    audio = b"".join(ok)
+    if len(ok) == len(parts):
+        _tts_cache_writes += 1
+        sweep = _tts_cache_writes % _TTS_CACHE_SWEEP_EVERY == 0
+        await asyncio.to_thread(_store_tts_cache, cache_path, audio, sweep)
+    return audio
+
+
+async def _silent_mp3() -> bytes:
+    """Generate a short silent MP3 clip using ffmpeg."""
+    audio = await _run_ffmpeg(
+        [
+            "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono", "-t", "0.5",
+            "-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3", "pipe:1",
+        ],
+        timeout=10,
+    )
+    if audio:
+        return audio
+
+    # Last resort: minimal silent WAV
     sr, dur = 16000, 0.5
     n = int(sr * dur)
     ds = n * 2
-    with open(path, "wb") as f:
-        f.write(b"RIFF" + struct.pack("<I", 36 + ds) + b"WAVE")
-        f.write(b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sr, sr * 2, 2, 16))
-        f.write(b"data" + struct.pack("<I", ds) + b"\x00" * ds)
-    logger.warning("Wrote silent WAV to %s (ffmpeg unavailable)", path)
+    logger.warning("Returning silent WAV (ffmpeg unavailable)")
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + ds, b"WAVE",
+        b"fmt ", 16, 1, 1, sr, sr * 2, 2, 16,
+        b"data", ds,
+    )
+    return header + bytes(ds)
+
+
+# ─── Pipeline: streaming orchestration ───
+
+
+class _Reply:
+    """Reply text accumulated while its audio streams; read via /api/reply/{id}."""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.done = asyncio.Event()
+
+
+_REPLIES: dict[str, _Reply] = {}
+_MAX_PENDING_REPLIES = 64
+
+
+def _pop_sentences(buffer: str) -> tuple[list[str], str]:
+    """Split complete sentences off the front of buffer; return (sentences, remainder)."""
+    parts = _SENT_RE.split(buffer)
+    rest = parts.pop()
+    sentences = []
+    current = ""
+    for p in parts:
+        current += p
+        # Punctuation- or whitespace-only pieces stay attached to what follows;
+        # on their own they yield no audio and only burn TTS retries.
+        if _WORD_RE.search(current):
+            sentences.append(current)
+            current = ""
+    return sentences, current + rest
+
+
+async def stream_reply_audio(
+    reply: _Reply, transcript: str, image_b64: bytes | None, language: str, voice: str, rate: str
+) -> AsyncIterator[bytes]:
+    """
+    Stream MP3 bytes for the agent's reply.
+    Each sentence is handed to edge-tts as soon as the LLM finishes it, so the
+    first audio goes out while the rest of the reply is still being generated.
+    """
+    pending: asyncio.Queue[asyncio.Task | None] = asyncio.Queue()
+
+    async def produce() -> None:
+        buffer = ""
+        try:
+            async for delta in stream_openclaw_reply(transcript, image_b64, language):
+                reply.text += delta
+                buffer += delta
+                sentences, buffer = _pop_sentences(buffer)
+                for sentence in sentences:
+                    await pending.put(asyncio.create_task(generate_tts(sentence, voice, rate)))
+            if buffer.strip():
+                await pending.put(asyncio.create_task(generate_tts(buffer, voice, rate)))
+        finally:
+            reply.text = reply.text.strip()
+            reply.done.set()
+            await pending.put(None)
+
+    producer = asyncio.create_task(produce())
+    sent_any = False
+    try:
+        while (task := await pending.get()) is not None:
+            audio = await task
+            if audio:
+                sent_any = True
+                yield audio
+        await producer
+    finally:
+        # Client went away mid-stream: stop the LLM read and any queued TTS.
+        producer.cancel()
+        while not pending.empty():
+            task = pending.get_nowait()
+            if task is not None:
+                task.cancel()
+
+    if not sent_any:
+        logger.warning("All TTS attempts failed, sending silent fallback")
+        yield await _silent_mp3()
 
 
 # ─── Entry Point ───
@@ -426,7 +740,7 @@ if __name__ == "__main__":
 
     print(f"🎥 {AGENT_NAME} Video Chat · {proto}://localhost:{PORT}")
     print(f"📡 OpenClaw API → {OPENCLAW_BASE}")
-    print(f"🎤 STT → Groq Whisper")
+    print(f"🎤 STT → Groq Whisper ({STT_MODEL})")
     print(f"🔊 TTS → edge-tts")
     if use_ssl:
         print(f"🔒 SSL → {ssl_cert}")
@@ -53,8 +53,10 @@ echo "   ✅ ffmpeg"
 # 2. Install Python deps
 echo ""
 echo "📦 Installing Python dependencies..."
-pip3 install --break-system-packages -q fastapi uvicorn python-multipart httpx edge-tts 2>/dev/null || \
-  pip3 install -q fastapi uvicorn python-multipart httpx edge-tts
+pip3 install --break-system-packages -q fastapi "uvicorn[standard]" python-multipart "httpx[http2]" edge-tts orjson 2>/dev/null || \
+  pip3 install -q fastapi "uvicorn[standard]" python-multipart "httpx[http2]" edge-tts orjson
+# Optional: PyAV decodes recordings in-process (ffmpeg CLI is the fallback)
+pip3 install --break-system-packages -q av 2>/dev/null || pip3 install -q av 2>/dev/null || true
 echo "   ✅ Done"
 
 # 3. Check Groq API key
@@ -17,7 +17,7 @@ fi
 command -v python3 >/dev/null 2>&1 || { echo "❌ python3 required. Run setup.sh first."; exit 1; }
 command -v ffmpeg  >/dev/null 2>&1 || { echo "❌ ffmpeg required. Run setup.sh first."; exit 1; }
 
-pip3 install --break-system-packages -q fastapi uvicorn python-multipart httpx edge-tts 2>/dev/null || \
-  pip3 install -q fastapi uvicorn python-multipart httpx edge-tts
+pip3 install --break-system-packages -q fastapi "uvicorn[standard]" python-multipart "httpx[http2]" edge-tts orjson 2>/dev/null || \
+  pip3 install -q fastapi "uvicorn[standard]" python-multipart "httpx[http2]" edge-tts orjson
 
 exec python3 server.py